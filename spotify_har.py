@@ -3,18 +3,155 @@
 Extract Spotify content from HAR (HTTP Archive) files
 """
 
+import asyncio
+import mmap
 import os
 import sys
 import json
 import re
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import base64
+import itertools
+import logging
+import logging.handlers
 import time
 import subprocess
-from typing import List, Dict, Optional, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Any, Iterable, Iterator, Tuple, Union
 from urllib.parse import unquote, urlparse, parse_qs
 
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore[assignment]
+
+try:
+    import ijson
+    try:
+        import ijson.backends.yajl2_c as ijson
+    except ImportError:
+        pass
+except ImportError:
+    ijson = None
+
+try:
+    import pybase64
+except ImportError:
+    pybase64 = None  # type: ignore[assignment]
+
+try:
+    import aiohttp
+    import aiofiles
+except ImportError:
+    aiohttp = None  # type: ignore[assignment]
+    aiofiles = None  # type: ignore[assignment]
+
+# Shims are plain functions rather than per-branch definitions so the module stays
+# compilable with mypyc
+def _loads(data: Union[str, bytes]) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def _dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, indent=2, ensure_ascii=False).encode('utf-8')
+
+def _b64decode(data: Union[str, bytes]) -> bytes:
+    if pybase64 is not None:
+        return pybase64.b64decode(data, validate=False)
+    return base64.b64decode(data)
+
+def _b64decode_text(data: Union[str, bytes]) -> str:
+    if pybase64 is not None:
+        return pybase64.b64decode_as_bytearray(data, validate=False).decode('utf-8')
+    return base64.b64decode(data).decode('utf-8')
+
+# HAR files larger than this are streamed entry-by-entry instead of loaded whole
+STREAM_THRESHOLD = 64 << 20
+
+# Concurrent CDN downloads; kept below the session's connection pool size
+DOWNLOAD_WORKERS = 16
+
+# Retries per download after the first attempt, with exponential backoff
+DOWNLOAD_RETRIES = 2
+RETRY_BACKOFF = 0.3
+
+DOWNLOAD_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.6998.178 Safari/537.36',
+    'Referer': 'https://open.spotify.com/',
+    'Accept': '*/*'
+}
+
+# Media type -> file extension, checked before sniffing the body
+_CONTENT_TYPE_EXTENSIONS = {
+    'image/jpeg': '.jpg',
+    'image/jpg': '.jpg',
+    'image/pjpeg': '.jpg',
+    'image/png': '.png',
+    'image/x-png': '.png',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+    'video/webm': '.webm',
+    'audio/webm': '.webm',
+    'video/mp4': '.mp4',
+    'audio/mp4': '.mp4'
+}
+
+# Magic-byte prefixes for formats identifiable from their first bytes alone
+_MAGIC_PREFIXES = (
+    (b'\xFF\xD8\xFF', '.jpg'),
+    (b'\x89PNG', '.png'),
+    (b'GIF8', '.gif'),
+    (b'\x1a\x45\xdf\xa3', '.webm')
+)
+
+# Spotify image IDs are 40 hex characters starting with 'ab67616'. The literal
+# prefix lets re skip ahead with a substring search
+IMAGE_ID_PATTERN = r'ab67616[a-f0-9]{33}'
+
+def _flush_log_buffers() -> None:
+    """Write out buffered log records so they land next to the progress output"""
+    sys.stdout.flush()
+    for handler in logging.getLogger().handlers:
+        handler.flush()
+
+def _url_host(url: str) -> str:
+    """Return the lowercase hostname of a URL without fully parsing it"""
+    host = url.partition('//')[2].partition('/')[0].partition('?')[0].partition('#')[0]
+    return host.rpartition('@')[2].partition(':')[0].lower()
+
+# Maps ASCII characters outside [\w\-.] to '_' for generate_filename
+_UNSAFE_FILENAME_CHARS = str.maketrans({chr(c): '_' for c in range(128)
+                                        if not re.match(r'[\w\-.]', chr(c))})
+
+# JSON keys in Spotify API payloads that hold image URLs
+_IMG_KEYS = frozenset({'image', 'images', 'cover_art', 'avatar', 'picture', 'artwork'})
+
 class SpotifyHARExtractor:
+    SPOTIFY_IMAGE_DOMAINS = (
+        'i.scdn.co',
+        'mosaic.scdn.co',
+        'seed-mix-image.spotifycdn.com',
+        'lineup-images.scdn.co',
+        'thisis-images.scdn.co',
+        'charts-images.scdn.co',
+        'daily-mix.scdn.co',
+        'mixed-media-images.spotifycdn.com'
+    )
+
+    SPOTIFY_VIDEO_DOMAINS = (
+        'video-akpcw.spotifycdn.com',
+        'video-fa723fc0e0b4479496acdae1c1f.spotifycdn.com',
+        'canvas.scdn.co',
+        'canvaz.scdn.co'
+    )
+
     def __init__(self):
         self.output_folder = "har_extracted"
         self.images_folder = os.path.join(self.output_folder, "images")
@@ -24,14 +161,35 @@ class SpotifyHARExtractor:
         for folder in [self.output_folder, self.images_folder, self.videos_folder, self.data_folder]:
             os.makedirs(folder, exist_ok=True)
 
+        self._images_prefix = self.images_folder + os.sep
+        self._videos_prefix = self.videos_folder + os.sep
+
+        self._run_timestamp = int(time.time())
+        self._filename_counter = itertools.count()
+
         self.found_urls = set()
         self.extracted_data = {}
 
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32,
+                              max_retries=Retry(total=DOWNLOAD_RETRIES, backoff_factor=RETRY_BACKOFF))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update(DOWNLOAD_HEADERS)
+
+        # Exact host matches plus '.domain' suffixes for any subdomains
+        self._image_hosts = frozenset(self.SPOTIFY_IMAGE_DOMAINS)
+        self._image_host_suffixes = tuple('.' + domain for domain in self.SPOTIFY_IMAGE_DOMAINS)
+        self._video_hosts = frozenset(self.SPOTIFY_VIDEO_DOMAINS)
+        self._video_host_suffixes = tuple('.' + domain for domain in self.SPOTIFY_VIDEO_DOMAINS)
+        self._id_re = re.compile(IMAGE_ID_PATTERN)
+        self._id_bytes_re = re.compile(IMAGE_ID_PATTERN.encode('ascii'))
+
     def load_har_file(self, har_path: str) -> Optional[Dict]:
         """Load and parse HAR file"""
         try:
-            with open(har_path, 'r', encoding='utf-8') as f:
-                har_data = json.load(f)
+            with open(har_path, 'rb') as f:
+                har_data = _loads(f.read())
             print(f"✅ Loaded HAR file: {har_path}")
             return har_data
         except Exception as e:
@@ -41,23 +199,26 @@ class SpotifyHARExtractor:
     def load_har_from_json_string(self, har_json: str) -> Optional[Dict]:
         """Load HAR data from JSON string"""
         try:
-            har_data = json.loads(har_json)
+            har_data = _loads(har_json.encode('utf-8') if isinstance(har_json, str) else har_json)
             print("✅ Loaded HAR data from JSON string")
             return har_data
         except Exception as e:
             print(f"❌ Error parsing HAR JSON: {e}")
             return None
 
-    def extract_spotify_images(self, har_data: Dict) -> List[Dict]:
-        """Extract Spotify image URLs and data from HAR"""
-        images = []
+    def extract_spotify_images(self, har_data: Union[Dict, Iterable[Dict]]) -> List[Dict]:
+        """Extract Spotify image URLs and data from HAR data or an iterable of entries"""
+        images: List[Dict] = []
 
-        if 'log' not in har_data or 'entries' not in har_data['log']:
-            print("❌ Invalid HAR format")
-            return images
+        if isinstance(har_data, dict):
+            if 'log' not in har_data or 'entries' not in har_data['log']:
+                print("❌ Invalid HAR format")
+                return images
 
-        entries = har_data['log']['entries']
-        print(f"🔍 Analyzing {len(entries)} HAR entries...")
+            entries = har_data['log']['entries']
+            print(f"🔍 Analyzing {len(entries)} HAR entries...")
+        else:
+            entries = har_data
 
         for entry in entries:
             try:
@@ -76,20 +237,13 @@ class SpotifyHARExtractor:
                         'headers': response.get('headers', [])
                     }
 
+                    # Embedded base64 bodies are decoded lazily when the media is saved
                     content = response.get('content', {})
                     if content:
                         image_info['content'] = content
 
-                        if content.get('encoding') == 'base64' and content.get('text'):
-                            try:
-                                decoded_data = base64.b64decode(content['text'])
-                                image_info['decoded_size'] = len(decoded_data)
-                                image_info['decoded_data'] = decoded_data
-                            except Exception as e:
-                                print(f"⚠️  Base64 decode error for {url}: {e}")
-
                     images.append(image_info)
-                    print(f"🖼️  Found Spotify image: {url}")
+                    logger.debug("🖼️  Found Spotify image: %s", url)
 
                 elif self.is_spotify_video_url(url):
                     video_info = {
@@ -105,52 +259,30 @@ class SpotifyHARExtractor:
                     content = response.get('content', {})
                     if content and content.get('text'):
                         video_info['content'] = content
-                        if content.get('encoding') == 'base64':
-                            try:
-                                decoded_data = base64.b64decode(content['text'])
-                                video_info['decoded_size'] = len(decoded_data)
-                                video_info['decoded_data'] = decoded_data
-                            except Exception as e:
-                                print(f"⚠️  Base64 decode error for video {url}: {e}")
 
                     images.append(video_info)  
-                    print(f"🎬 Found Spotify video: {url}")
+                    logger.debug("🎬 Found Spotify video: %s", url)
 
                 elif 'api.spotify.com' in url or 'spclient' in url:
                     self.extract_api_image_references(entry, url)
 
             except Exception as e:
-                print(f"⚠️  Error processing entry: {e}")
+                logger.warning("⚠️  Error processing entry: %s", e)
                 continue
 
+        _flush_log_buffers()
         print(f"📊 Found {len(images)} Spotify media URLs")
         return images
 
     def is_spotify_image_url(self, url: str) -> bool:
         """Check if URL is a Spotify image CDN URL"""
-        spotify_image_domains = [
-            'i.scdn.co',
-            'mosaic.scdn.co',
-            'seed-mix-image.spotifycdn.com',
-            'lineup-images.scdn.co',
-            'thisis-images.scdn.co',
-            'charts-images.scdn.co',
-            'daily-mix.scdn.co',
-            'mixed-media-images.spotifycdn.com'
-        ]
-
-        return any(domain in url for domain in spotify_image_domains)
+        host = _url_host(url)
+        return host in self._image_hosts or host.endswith(self._image_host_suffixes)
 
     def is_spotify_video_url(self, url: str) -> bool:
         """Check if URL is a Spotify video/canvas URL"""
-        spotify_video_domains = [
-            'video-akpcw.spotifycdn.com',
-            'video-fa723fc0e0b4479496acdae1c1f.spotifycdn.com',
-            'canvas.scdn.co',
-            'canvaz.scdn.co'
-        ]
-
-        return any(domain in url for domain in spotify_video_domains)
+        host = _url_host(url)
+        return host in self._video_hosts or host.endswith(self._video_host_suffixes)
 
     def get_content_type(self, response: Dict) -> str:
         """Extract content type from response headers"""
@@ -160,7 +292,7 @@ class SpotifyHARExtractor:
                 return header.get('value', '')
         return ''
 
-    def extract_api_image_references(self, entry: Dict, url: str):
+    def extract_api_image_references(self, entry: Dict, url: str) -> None:
         """Extract image references from API responses"""
         try:
             response = entry.get('response', {})
@@ -171,118 +303,338 @@ class SpotifyHARExtractor:
 
                 if content.get('encoding') == 'base64':
                     try:
-                        text = base64.b64decode(text).decode('utf-8')
+                        text = _b64decode_text(text)
                     except:
                         return
 
                 try:
-                    json_data = json.loads(text)
+                    json_data = _loads(text)
                     self.find_images_in_json(json_data, url)
                 except:
 
                     self.find_image_patterns_in_text(text, url)
 
         except Exception as e:
-            print(f"⚠️  Error extracting API references from {url}: {e}")
-
-    def find_images_in_json(self, data: Any, source_url: str):
-        """Recursively find image URLs in JSON data"""
-        if isinstance(data, dict):
-            for key, value in data.items():
-                if key in ['image', 'images', 'cover_art', 'avatar', 'picture', 'artwork']:
-                    if isinstance(value, str) and self.is_spotify_image_url(value):
-                        self.found_urls.add(value)
-                        print(f"🔗 Found image reference in API: {value}")
-                elif isinstance(value, (dict, list)):
-                    self.find_images_in_json(value, source_url)
-        elif isinstance(data, list):
-            for item in data:
-                self.find_images_in_json(item, source_url)
-
-    def find_image_patterns_in_text(self, text: str, source_url: str):
+            logger.warning("⚠️  Error extracting API references from %s: %s", url, e)
+
+    def find_images_in_json(self, data: Any, source_url: str) -> None:
+        """Find image URLs in JSON data"""
+        stack: List[Any] = [data]
+
+        while stack:
+            node = stack.pop()
+
+            if isinstance(node, dict):
+                for key, value in node.items():
+                    if isinstance(value, str):
+                        if key in _IMG_KEYS and self.is_spotify_image_url(value):
+                            self.found_urls.add(value)
+                            logger.debug("🔗 Found image reference in API: %s", value)
+                    elif isinstance(value, (dict, list)):
+                        stack.append(value)
+            elif isinstance(node, list):
+                stack.extend(item for item in node if isinstance(item, (dict, list)))
+
+    def find_image_patterns_in_text(self, text: str, source_url: str) -> None:
         """Find image URL patterns in text"""
 
-        patterns = [
-            r'ab67616[a-f0-9]{32}',  
-            r'ab6761610000[a-f0-9]{24}',  
-            r'ab67616d[a-f0-9]{32}',  
+        for id_match in self._id_re.finditer(text):
+            self.add_image_id(id_match.group(0))
+
+    def add_image_id(self, image_id: str) -> None:
+        """Record the CDN URLs for a Spotify image ID"""
+        image_urls = [
+            f"https://i.scdn.co/image/{image_id}",
+            f"https://mosaic.scdn.co/640/{image_id}",
+            f"https://mosaic.scdn.co/300/{image_id}"
         ]
 
-        for pattern in patterns:
-            matches = re.findall(pattern, text)
-            for match in matches:
+        for img_url in image_urls:
+            self.found_urls.add(img_url)
+            logger.debug("🔗 Found image pattern: %s", img_url)
+
+    def scan_har_for_image_ids(self, har_path: str) -> List[str]:
+        """Find Spotify image IDs by scanning the raw HAR bytes without parsing JSON.
 
-                image_urls = [
-                    f"https://i.scdn.co/image/{match}",
-                    f"https://mosaic.scdn.co/640/{match}",
-                    f"https://mosaic.scdn.co/300/{match}"
-                ]
+        Only IDs that appear as plain text are found; base64-encoded bodies need
+        the full process_har_file pass.
+        """
+        image_ids = set()
 
-                for img_url in image_urls:
-                    self.found_urls.add(img_url)
-                    print(f"🔗 Found image pattern: {img_url}")
+        try:
+            with open(har_path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return []
+
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    for id_match in self._id_bytes_re.finditer(mm):
+                        image_ids.add(id_match.group(0).decode('ascii'))
+        except Exception as e:
+            print(f"❌ Error scanning HAR file: {e}")
+            return []
+
+        for image_id in sorted(image_ids):
+            self.add_image_id(image_id)
+
+        _flush_log_buffers()
+        print(f"📊 Found {len(image_ids)} Spotify image IDs")
+        return sorted(image_ids)
 
     def download_media(self, media_info: Dict) -> Optional[str]:
         """Download media file from URL or use embedded data"""
         url = media_info['url']
 
-        if 'decoded_data' in media_info:
-            return self.save_embedded_media(media_info)
+        data = self.decode_embedded_media(media_info)
+        if data is not None:
+            return self.save_embedded_media(media_info, data)
 
         try:
             print(f"📥 Downloading: {url}")
 
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.6998.178 Safari/537.36',
-                'Referer': 'https://open.spotify.com/',
-                'Accept': '*/*'
-            }
+            with self.session.get(url, timeout=30, stream=True) as response:
+                chunks = response.iter_content(1 << 16)
 
-            response = requests.get(url, headers=headers, timeout=30)
+                # Buffer just enough of the body to sniff the file type
+                head = b''
+                if response.status_code == 200:
+                    for chunk in chunks:
+                        head += chunk
+                        if len(head) > 100:
+                            break
 
-            if response.status_code == 200 and len(response.content) > 100:
+                target = self.start_download(media_info, response.status_code, response.headers, head)
+                if target is None:
+                    return None
+                filepath, segment_data = target
 
-                content_type = response.headers.get('content-type', '').lower()
-                ext = self.get_file_extension(content_type, response.content)
+                size = len(head)
+                try:
+                    with open(filepath + '.part', 'wb') as f:
+                        f.write(head)
+                        for chunk in chunks:
+                            f.write(chunk)
+                            size += len(chunk)
+                            if segment_data is not None:
+                                segment_data += chunk
+                except BaseException:
+                    self._discard_part(filepath)
+                    raise
+
+            return self.finish_download(media_info, filepath, segment_data, size)
 
-                filename = self.generate_filename(url, ext)
+        except Exception as e:
+            print(f"❌ Download error for {url}: {e}")
 
-                if 'video' in content_type or ext in ['.webm', '.mp4'] or 'video-akpcw.spotifycdn.com' in url:
-                    filepath = os.path.join(self.videos_folder, filename)
+        return None
 
-                    if 'webm' in url.lower() or ext == '.webm':
+    async def download_media_async(self, session: 'aiohttp.ClientSession', media_info: Dict) -> Optional[str]:
+        """Async counterpart of download_media using aiohttp and aiofiles"""
+        url = media_info['url']
 
-                        media_info['is_video_segment'] = True
-                        media_info['segment_data'] = response.content
+        # Decoding and writing a large embedded body would otherwise stall
+        # every in-flight download on the event loop
+        if self.has_embedded_media(media_info):
+            data = await asyncio.to_thread(self.decode_embedded_media, media_info)
+            if data is not None:
+                return await asyncio.to_thread(self.save_embedded_media, media_info, data)
 
-                        if 'inits' in url:
-                            media_info['segment_type'] = 'init'
-                        elif '/0.webm' in url or '/1.webm' in url or '/2.webm' in url:
-                            media_info['segment_type'] = 'media'
-                        else:
-                            media_info['segment_type'] = 'unknown'
+        print(f"📥 Downloading: {url}")
 
-                        print(f"🎬 Video segment detected: {media_info['segment_type']}")
+        # Mirrors the Retry policy mounted on the requests session
+        for attempt in range(DOWNLOAD_RETRIES + 1):
+            try:
+                return await self._fetch_async(session, media_info)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == DOWNLOAD_RETRIES:
+                    print(f"❌ Download error for {url}: {e!r}")
                 else:
-                    filepath = os.path.join(self.images_folder, filename)
+                    await asyncio.sleep(RETRY_BACKOFF * (2 ** attempt))
+            except Exception as e:
+                print(f"❌ Download error for {url}: {e!r}")
+                break
 
-                with open(filepath, 'wb') as f:
-                    f.write(response.content)
+        return None
+
+    async def _fetch_async(self, session: 'aiohttp.ClientSession', media_info: Dict) -> Optional[str]:
+        """Stream one response body to disk; network errors propagate for retrying"""
+        async with session.get(media_info['url']) as response:
+            chunks = response.content.iter_chunked(1 << 16)
+
+            head = b''
+            if response.status == 200:
+                async for chunk in chunks:
+                    head += chunk
+                    if len(head) > 100:
+                        break
+
+            target = self.start_download(media_info, response.status, response.headers, head)
+            if target is None:
+                return None
+            filepath, segment_data = target
+
+            size = len(head)
+            try:
+                async with aiofiles.open(filepath + '.part', 'wb') as f:
+                    await f.write(head)
+                    async for chunk in chunks:
+                        await f.write(chunk)
+                        size += len(chunk)
+                        if segment_data is not None:
+                            segment_data += chunk
+            except BaseException:
+                self._discard_part(filepath)
+                raise
+
+        return self.finish_download(media_info, filepath, segment_data, size)
+
+    def start_download(self, media_info: Dict, status: int, headers: Any,
+                       head: bytes) -> Optional[Tuple[str, Optional[bytearray]]]:
+        """Validate a response from its status and sniffed head bytes.
+
+        Returns the target path and segment buffer from prepare_download, or None
+        when the response is not worth saving. The body is written to the
+        target path plus '.part' until finish_download moves it into place.
+        """
+        if len(head) <= 100:
+            print(f"❌ Download failed: {status}")
+            return None
 
-                print(f"✅ Downloaded: {filepath} ({len(response.content)} bytes)")
-                return filepath
+        content_type = headers.get('content-type', '').lower()
+        return self.prepare_download(media_info, content_type, head)
+
+    def finish_download(self, media_info: Dict, filepath: str,
+                        segment_data: Optional[bytearray], size: int) -> str:
+        """Move a completed .part file into place and record segment data"""
+        os.replace(filepath + '.part', filepath)
+
+        # Segments are only flagged once complete so a failed download never
+        # leaves a flagged entry without data for combine_webm_segments
+        if segment_data is not None:
+            url = media_info['url']
+            media_info['is_video_segment'] = True
+            media_info['segment_data'] = segment_data
+
+            if 'inits' in url:
+                media_info['segment_type'] = 'init'
+            elif '/0.webm' in url or '/1.webm' in url or '/2.webm' in url:
+                media_info['segment_type'] = 'media'
             else:
-                print(f"❌ Download failed: {response.status_code}")
+                media_info['segment_type'] = 'unknown'
 
-        except Exception as e:
-            print(f"❌ Download error for {url}: {e}")
+            print(f"🎬 Video segment detected: {media_info['segment_type']}")
 
-        return None
+        print(f"✅ Downloaded: {filepath} ({size} bytes)")
+        return filepath
+
+    def _discard_part(self, filepath: str) -> None:
+        """Remove the partial file left by a failed download"""
+        try:
+            os.remove(filepath + '.part')
+        except OSError:
+            pass
+
+    async def _download_group_async(self, session: 'aiohttp.ClientSession', group: List[Dict]) -> List[Optional[str]]:
+        """Download media sharing one output name one after another"""
+        results = []
+        for media_info in group:
+            results.append(await self.download_media_async(session, media_info))
+        return results
+
+    async def _download_all_async(self, groups: List[List[Dict]]) -> List[List[Optional[str]]]:
+        """Download media groups over one shared aiohttp connection pool"""
+        connector = aiohttp.TCPConnector(limit=32, limit_per_host=8, ttl_dns_cache=300,
+                                         enable_cleanup_closed=True)
+        # No total budget: it would also count time spent queued for a connector
+        # slot, so only individual socket operations are bounded
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=30)
+
+        # trust_env picks up HTTP(S)_PROXY/NO_PROXY and .netrc like requests does
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                         headers=DOWNLOAD_HEADERS, trust_env=True) as session:
+            return await asyncio.gather(*(self._download_group_async(session, g) for g in groups))
+
+    def prepare_download(self, media_info: Dict, content_type: str, head: bytes) -> Tuple[str, Optional[bytearray]]:
+        """Pick the output path for a download.
+
+        Returns the file path and, for WebM segments, a bytearray seeded with
+        ``head`` that the caller extends with the rest of the body.
+        """
+        url = media_info['url']
+        ext = self.get_file_extension(content_type, head)
+
+        filename = self.generate_filename(url, ext)
+        segment_data = None
+
+        if 'video' in content_type or ext in ['.webm', '.mp4'] or 'video-akpcw.spotifycdn.com' in url:
+            filepath = self._videos_prefix + filename
+
+            if 'webm' in url.lower() or ext == '.webm':
+                segment_data = bytearray(head)
+        else:
+            filepath = self._images_prefix + filename
+
+        return filepath, segment_data
+
+    def download_all(self, media_list: List[Dict]) -> List[str]:
+        """Download media concurrently, returning the paths that were saved"""
+        if not media_list:
+            return []
 
-    def save_embedded_media(self, media_info: Dict) -> Optional[str]:
+        try:
+            asyncio.get_running_loop()
+            in_event_loop = True
+        except RuntimeError:
+            in_event_loop = False
+
+        # Media that map to the same output name (e.g. the i.scdn.co and mosaic
+        # URLs for one image ID) run serially within one task so that no two
+        # workers ever write the same file; the last complete download wins
+        groups: Dict[str, List[Dict]] = {}
+        for media_info in media_list:
+            groups.setdefault(self.generate_filename(media_info['url'], ''), []).append(media_info)
+
+        if aiohttp is not None and aiofiles is not None and not in_event_loop:
+            results = asyncio.run(self._download_all_async(list(groups.values())))
+        else:
+            with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as pool:
+                results = list(pool.map(self._download_group, groups.values()))
+
+        # dict.fromkeys drops repeated paths while keeping download order
+        return list(dict.fromkeys(filepath for group_results in results
+                                  for filepath in group_results if filepath))
+
+    def _download_group(self, group: List[Dict]) -> List[Optional[str]]:
+        """Download media sharing one output name one after another"""
+        return [self.download_media(media_info) for media_info in group]
+
+    def has_embedded_media(self, media_info: Dict) -> bool:
+        """Check whether the HAR carries the media body itself"""
+        if 'decoded_data' in media_info:
+            return True
+
+        content = media_info.get('content') or {}
+        return content.get('encoding') == 'base64' and bool(content.get('text'))
+
+    def decode_embedded_media(self, media_info: Dict) -> Optional[bytes]:
+        """Decode the base64 body embedded in the HAR, if there is one"""
+        if not self.has_embedded_media(media_info):
+            return None
+        if 'decoded_data' in media_info:
+            return media_info['decoded_data']
+
+        content = media_info['content']
+        try:
+            return _b64decode(content['text'])
+        except Exception as e:
+            print(f"⚠️  Base64 decode error for {media_info['url']}: {e}")
+            return None
+
+    def save_embedded_media(self, media_info: Dict, data: Optional[bytes] = None) -> Optional[str]:
         """Save embedded media data from HAR"""
         try:
-            data = media_info['decoded_data']
+            if data is None:
+                data = media_info['decoded_data']
+            media_info['decoded_size'] = len(data)
             url = media_info['url']
             content_type = media_info.get('content_type', '')
 
@@ -291,9 +643,9 @@ class SpotifyHARExtractor:
             filename = self.generate_filename(url, ext)
 
             if 'video' in content_type or ext in ['.webm', '.mp4']:
-                filepath = os.path.join(self.videos_folder, filename)
+                filepath = self._videos_prefix + filename
             else:
-                filepath = os.path.join(self.images_folder, filename)
+                filepath = self._images_prefix + filename
 
             with open(filepath, 'wb') as f:
                 f.write(data)
@@ -308,30 +660,19 @@ class SpotifyHARExtractor:
     def get_file_extension(self, content_type: str, data: bytes) -> str:
         """Determine file extension from content type or data"""
 
-        if 'jpeg' in content_type or 'jpg' in content_type:
-            return '.jpg'
-        elif 'png' in content_type:
-            return '.png'
-        elif 'gif' in content_type:
-            return '.gif'
-        elif 'webp' in content_type:
-            return '.webp'
-        elif 'webm' in content_type:
-            return '.webm'
-        elif 'mp4' in content_type:
-            return '.mp4'
+        media_type = content_type.split(';', 1)[0].strip().lower()
+        ext = _CONTENT_TYPE_EXTENSIONS.get(media_type)
+        if ext:
+            return ext
+
+        for magic, ext in _MAGIC_PREFIXES:
+            if data.startswith(magic):
+                return ext
 
-        if data.startswith(b'\xFF\xD8\xFF'):
-            return '.jpg'
-        elif data.startswith(b'\x89PNG'):
-            return '.png'
-        elif data.startswith(b'GIF8'):
-            return '.gif'
-        elif data.startswith(b'RIFF') and b'WEBP' in data[:20]:
+        # Offset-aware startswith compares in place without slicing the body
+        if data.startswith(b'RIFF') and data.startswith(b'WEBP', 8):
             return '.webp'
-        elif data.startswith(b'\x1a\x45\xdf\xa3'):  
-            return '.webm'
-        elif data.startswith(b'\x00\x00\x00') and b'ftyp' in data[:20]:
+        elif data.startswith(b'ftyp', 4):
             return '.mp4'
 
         return '.bin'  
@@ -348,17 +689,40 @@ class SpotifyHARExtractor:
             if '.' in base_name:
                 base_name = base_name.rsplit('.', 1)[0]
         else:
-            base_name = f"spotify_media_{int(time.time())}"
+            base_name = f"spotify_media_{self._run_timestamp}_{next(self._filename_counter)}"
 
-        safe_name = re.sub(r'[^\w\-_.]', '_', base_name)
+        if base_name.isascii():
+            safe_name = base_name.translate(_UNSAFE_FILENAME_CHARS)
+        else:
+            safe_name = re.sub(r'[^\w\-_.]', '_', base_name)
         return f"{safe_name}{ext}"
 
-    def save_analysis_report(self, har_data: Dict, extracted_media: List[Dict]) -> str:
+    def get_har_info(self, har_data: Dict) -> Dict:
+        """Collect HAR metadata for the analysis report"""
+        log = har_data.get('log', {})
+        return {
+            'version': log.get('version', ''),
+            'creator': log.get('creator', {}),
+            'total_entries': len(log.get('entries', []))
+        }
+
+    def save_analysis_report(self, har_info: Dict, extracted_media: List[Dict],
+                             timestamp: Optional[int] = None) -> str:
         """Save detailed analysis report"""
-        report_file = os.path.join(self.data_folder, f"har_analysis_{int(time.time())}.json")
+        if timestamp is None:
+            timestamp = int(time.time())
+        report_file = os.path.join(self.data_folder, f"har_analysis_{timestamp}.json")
 
         clean_media = []
+        image_count = 0
+        video_count = 0
         for media in extracted_media:
+            content_type = media.get('content_type', '')
+            if 'image' in content_type:
+                image_count += 1
+            if 'video' in content_type:
+                video_count += 1
+
             clean_item = {}
             for key, value in media.items():
                 if key in ['segment_data', 'decoded_data']:
@@ -372,23 +736,19 @@ class SpotifyHARExtractor:
 
         analysis = {
             'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
-            'har_info': {
-                'version': har_data.get('log', {}).get('version', ''),
-                'creator': har_data.get('log', {}).get('creator', {}),
-                'total_entries': len(har_data.get('log', {}).get('entries', []))
-            },
+            'har_info': har_info,
             'extraction_summary': {
                 'total_media_found': len(extracted_media),
-                'images': len([m for m in extracted_media if 'image' in m.get('content_type', '')]),
-                'videos': len([m for m in extracted_media if 'video' in m.get('content_type', '')]),
+                'images': image_count,
+                'videos': video_count,
                 'unique_urls': len(self.found_urls)
             },
             'extracted_media': clean_media,
             'found_urls': list(self.found_urls)
         }
 
-        with open(report_file, 'w', encoding='utf-8') as f:
-            json.dump(analysis, f, indent=2, ensure_ascii=False)
+        with open(report_file, 'wb') as f:
+            f.write(_dumps(analysis))
 
         print(f"📊 Analysis report saved: {report_file}")
         return report_file
@@ -397,20 +757,78 @@ class SpotifyHARExtractor:
         """Process a HAR file and extract all Spotify content"""
         print(f"🎵 Processing HAR file: {har_path}")
 
+        try:
+            stream = ijson is not None and os.path.getsize(har_path) > STREAM_THRESHOLD
+        except OSError:
+            # Let load_har_file report the unreadable path
+            stream = False
+
+        if stream:
+            return self.process_har_stream(har_path)
+
         har_data = self.load_har_file(har_path)
         if not har_data:
             return {'success': False, 'error': 'Failed to load HAR file'}
 
         return self.process_har_data(har_data)
 
+    def process_har_stream(self, har_path: str) -> Dict:
+        """Process a HAR file entry-by-entry without loading it into memory"""
+        if ijson is None:
+            return {'success': False, 'error': 'ijson is required for streaming HAR files'}
+
+        try:
+            with open(har_path, 'rb') as f:
+                har_info = self.read_har_header(f)
+
+                if har_info is None:
+                    print("❌ Invalid HAR format")
+                    har_info = {'version': '', 'creator': {}, 'total_entries': 0}
+                    extracted_media = []
+                else:
+                    f.seek(0)
+
+                    print(f"🔍 Streaming HAR entries from {har_path}...")
+                    entries = ijson.items(f, 'log.entries.item', use_float=True)
+                    extracted_media = self.extract_spotify_images(self._count_entries(entries, har_info))
+        except Exception as e:
+            print(f"❌ Error streaming HAR file: {e}")
+            return {'success': False, 'error': 'Failed to stream HAR file'}
+
+        return self.process_extracted_media(extracted_media, har_info)
+
+    def read_har_header(self, f) -> Optional[Dict]:
+        """Read HAR version and creator, stopping at the entries array.
+
+        Returns None when the document has no log.entries.
+        """
+        har_info: Dict[str, Any] = {'version': '', 'creator': {}, 'total_entries': 0}
+
+        for prefix, event, value in ijson.parse(f):
+            if prefix == 'log.entries':
+                return har_info
+            if prefix == 'log.version' and event == 'string':
+                har_info['version'] = value
+            elif prefix.startswith('log.creator.') and event in ('string', 'number'):
+                har_info['creator'][prefix[len('log.creator.'):]] = value
+
+        return None
+
+    def _count_entries(self, entries: Iterable[Dict], har_info: Dict) -> Iterator[Dict]:
+        """Yield entries while tallying them into har_info"""
+        for entry in entries:
+            har_info['total_entries'] += 1
+            yield entry
+
     def combine_webm_segments(self, extracted_media: List[Dict]) -> List[str]:
         """Combine WebM segments into playable videos"""
         combined_videos = []
 
-        segment_groups = {}
+        segment_groups: Dict[str, Dict] = {}
 
         for media_info in extracted_media:
-            if media_info.get('is_video_segment') and 'video-akpcw.spotifycdn.com' in media_info['url']:
+            if (media_info.get('is_video_segment') and 'segment_data' in media_info
+                    and 'video-akpcw.spotifycdn.com' in media_info['url']):
                 url = media_info['url']
 
                 import re
@@ -442,18 +860,17 @@ class SpotifyHARExtractor:
 
                 if init_segment and media_segments:
 
-                    combined_data = init_segment['segment_data']
-
-                    for segment in media_segments:
-                        combined_data += segment['segment_data']
-
                     output_filename = f"spotify_canvas_{group_key}.webm"
-                    output_path = os.path.join(self.videos_folder, output_filename)
+                    output_path = self._videos_prefix + output_filename
 
+                    # Write segments straight to disk rather than concatenating in memory
+                    combined_size = 0
                     with open(output_path, 'wb') as f:
-                        f.write(combined_data)
+                        for segment in [init_segment] + media_segments:
+                            f.write(segment['segment_data'])
+                            combined_size += len(segment['segment_data'])
 
-                    print(f"✅ Combined video saved: {output_path} ({len(combined_data)} bytes)")
+                    print(f"✅ Combined video saved: {output_path} ({combined_size} bytes)")
                     combined_videos.append(output_path)
 
                     mp4_path = self.convert_to_mp4(output_path)
@@ -550,26 +967,25 @@ class SpotifyHARExtractor:
 
         extracted_media = self.extract_spotify_images(har_data)
 
-        downloaded_files = []
-        for media_info in extracted_media:
-            filepath = self.download_media(media_info)
-            if filepath:
-                downloaded_files.append(filepath)
+        return self.process_extracted_media(extracted_media, self.get_har_info(har_data))
+
+    def process_extracted_media(self, extracted_media: List[Dict], har_info: Dict) -> Dict:
+        """Download extracted media, combine video segments and write the report"""
+        run_timestamp = int(time.time())
+        downloaded_files = self.download_all(extracted_media)
 
         combined_videos = self.combine_webm_segments(extracted_media)
         downloaded_files.extend(combined_videos)
 
+        seen_urls = {m['url'] for m in extracted_media}
+        referenced_media = []
         for url in self.found_urls:
-            if url not in [m['url'] for m in extracted_media]:
-                try:
-                    media_info = {'url': url, 'content_type': 'image/jpeg'}
-                    filepath = self.download_media(media_info)
-                    if filepath:
-                        downloaded_files.append(filepath)
-                except Exception as e:
-                    print(f"⚠️  Error downloading {url}: {e}")
+            if url not in seen_urls:
+                referenced_media.append({'url': url, 'content_type': 'image/jpeg'})
+
+        downloaded_files.extend(self.download_all(referenced_media))
 
-        report_file = self.save_analysis_report(har_data, extracted_media)
+        report_file = self.save_analysis_report(har_info, extracted_media, run_timestamp)
 
         # Count different file types
         mp4_files = [f for f in downloaded_files if f.endswith('.mp4')]
@@ -592,11 +1008,26 @@ def main():
     print("=" * 60)
     print("Extract Spotify content from HAR (HTTP Archive) files")
 
+    flags = {'--ids-only', '--verbose'}
+    args = [arg for arg in sys.argv[1:] if arg not in flags]
+    ids_only = '--ids-only' in sys.argv[1:]
+    verbose = '--verbose' in sys.argv[1:]
+
+    # Per-entry messages are DEBUG; buffer them so verbose runs avoid a write per line
+    handler = logging.handlers.MemoryHandler(4096, flushLevel=logging.WARNING,
+                                             target=logging.StreamHandler(sys.stderr))
+    logging.basicConfig(level=logging.INFO, format='%(message)s', handlers=[handler])
+    logger.setLevel(logging.DEBUG if verbose else logging.INFO)
+
     extractor = SpotifyHARExtractor()
 
-    if len(sys.argv) > 1:
-        har_file = sys.argv[1]
-        if os.path.exists(har_file):
+    if args:
+        har_file = args[0]
+        if os.path.exists(har_file) and ids_only:
+            for image_id in extractor.scan_har_for_image_ids(har_file):
+                print(image_id)
+            return
+        elif os.path.exists(har_file):
             results = extractor.process_har_file(har_file)
         else:
             print(f"❌ HAR file not found: {har_file}")